@@ -17,9 +17,20 @@
 # plus the login credentials (see USAGE). The program will figure out by itself whether the parameter is a file.
 # The end date is optional and defaults to today.
 # The date range is limited to 555 days (a little more than 1 1/2 years). A longer interval does not give more insight.
+#
+# PyPy
+# --------------------------
+# The program only uses the standard library (plus the jira package in pxc_jira.py), so it runs unchanged on PyPy.
+# PyPy's JIT is a lot faster on big CSV exports than CPython: pypy3 main.py <same arguments as above>
+# The jira package has to be installed into the PyPy environment, too.
 import sys
 import csv
-from datetime import datetime, timedelta
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from functools import lru_cache
+from itertools import chain, groupby, islice
+from operator import itemgetter
 import os
 from pathlib import Path
 
@@ -33,17 +44,17 @@ KEY_COL = 'key'
 BOARD_COL = 'bdate'
 POINTS_THRESHOLD = 5
 MOVING_AVG_INTERVAL = 28
+TYPE_INDEX = {'bug': 0, 'task': 1, 'story': 2}  # slot of each issue type in the report_values entries
+# the issue type -> first slot of the type in the totals of a report_values entry (see new_day_values)
+# The names as spelled by Jira are included, which saves lowercasing the type of every row.
+_TYPE_BASE = {'bug': 0, 'task': 2, 'story': 4, 'Bug': 0, 'Task': 2, 'Story': 4}
 
 
-def daterange(date_from, date_to):
-    for n in range(int((date_to - date_from).days) + 1):
-        yield date_from + timedelta(n)
-
-
-def find_column(row, text):
+# columns is a dict of column name -> index of the heading row
+def find_column(columns, text):
     try:
-        return row.index(text)
-    except ValueError:
+        return columns[text]
+    except KeyError:
         print('Could not find column "{}", exiting'.format(text))
         exit(1)
 
@@ -51,11 +62,14 @@ def find_column(row, text):
 # Detect the required columns and produce a dict with the column indexes
 # This is a safety measure against any column order change or name change in the Jira report
 def column_configuration(row, config):
+    columns = {}
+    for i, name in enumerate(row):
+        columns.setdefault(name, i)  # Jira exports repeat some column names, the first one counts
     config.update(
-        {RESOLVED_COL: find_column(row, 'Resolved'), ISSUETYPE_COL: find_column(row, 'Issue Type'),
-         POINTS_COL: find_column(row, 'Custom field (Story Points)'), KEY_COL: find_column(row, 'Issue key')})
+        {RESOLVED_COL: find_column(columns, 'Resolved'), ISSUETYPE_COL: find_column(columns, 'Issue Type'),
+         POINTS_COL: find_column(columns, 'Custom field (Story Points)'), KEY_COL: find_column(columns, 'Issue key')})
     if config['is_project']:
-        config[BOARD_COL] = find_column(row, 'board enter date')
+        config[BOARD_COL] = find_column(columns, 'board enter date')
 
 
 # The time is rounded down to 0:0:0, we are only interested in the day.
@@ -72,180 +86,221 @@ def get_issue_key(row, config):
 
 
 # CSV export will give us strings, the Jira online report returns numbers
-def get_points(row, config):
-    p = row[config[POINTS_COL]]
+def parse_points(p):
     if p == '':
         return 0
     else:
         return float(p)
 
 
-def day_key(d):
-    return d.strftime('%d.%m.%Y')
+def get_points(row, config):
+    return row[config[POINTS_COL]]
 
 
-# date of resolution
-def get_resolved_date(row, config):
-    return round_down_time(datetime.strptime(row[config[RESOLVED_COL]], '%d.%m.%y %H:%M'))
+# lookup table of the formatted days, one entry per day of the report
+_day_keys = {}
 
 
-# date when issue entered the Kanban board
-def get_board_enter_date(row, config):
-    return round_down_time(datetime.strptime(row[config[BOARD_COL]], '%d.%m.%y %H:%M'))
+# the output form '%d.%m.%Y' of a day ordinal (see date.toordinal), each day is formatted only once
+def day_key(ordinal):
+    key = _day_keys.get(ordinal)
+    if key is None:
+        d = date.fromordinal(ordinal)
+        key = _day_keys[ordinal] = f'{d.day:02}.{d.month:02}.{d.year}'
+    return key
 
 
-# get the date of the first data row; row 0 is the heading
-def get_start_date(rows, config):
-    if len(rows) > 1:
-        return get_resolved_date(rows[1], config)
+# We are only interested in the day, so only the date in front of the time ('%d.%m.%y %H:%M') is parsed.
+def parse_date(text):
+    return parse_day(text.partition(' ')[0])
 
 
-# get the date from the last data row
-def get_end_date(rows, config):
-    if (len(rows)) > 1:
-        return get_resolved_date(rows[-1], config)
+@lru_cache(maxsize=None)
+def parse_day(text):
+    return datetime.strptime(text, '%d.%m.%y')
+
+
+# Replace the date and points values of each data row with the parsed values while the rows stream by, so that every
+# value is parsed exactly once no matter how often the calculations look at it afterwards.
+def parse_rows(rows, config):
+    date_cols = [config[RESOLVED_COL]]
+    if config['is_project']:
+        date_cols.append(config[BOARD_COL])
+    points_col = config[POINTS_COL]
+    for row in rows:
+        for c in date_cols:
+            row[c] = parse_date(row[c])
+        row[points_col] = parse_points(row[points_col])
+        yield row
+
+
+# date of resolution
+def get_resolved_date(row, config):
+    return row[config[RESOLVED_COL]]
 
 
 # an empty structure for a single report_value entry
+# totals is the flat list [bug_count, bug_points, task_count, task_points, story_count, story_points], which already is
+# the serialized form of the day. The issue lists hold one slot per issue type (see TYPE_INDEX).
 def new_day_values():
-    return {'bug': {'count': 0, 'points': 0.0, 'board_days': [], 'days_per_point': []},
-            'story': {'count': 0, 'points': 0.0, 'board_days': [], 'days_per_point': []},
-            'task': {'count': 0, 'points': 0.0, 'board_days': [], 'days_per_point': []}}
-
-
-# Process a single row and update report_values for the matching date.
-# report_values is a dict with key = date with values that are aggregated/collected/calculated for this day.
-def process_row(row, report_values, config):
-    issue_type = get_issue_type(row, config)
-    res_date = get_resolved_date(row, config)
-    key = day_key(res_date)
-
-    values = report_values.setdefault(key, new_day_values())
-    values[issue_type]['count'] += 1
-    p = get_points(row, config)
-    if p != 0:
-        values[issue_type]['points'] += float(p)
-
-    if config['is_project']:    # CSV exports don't have the history
-        board_date = get_board_enter_date(row, config)
-        board_time = res_date - board_date
-        # board_days is a list of issues with their days spent on the Kanban board
-        values[issue_type]['board_days'].append({'issue_key': get_issue_key(row, config), 'days': board_time.days + 1})
-        if p != 0:
-            values[issue_type]['days_per_point'].append({'issue_key': get_issue_key(row, config),
-                                                         'days': board_time.days + 1,
-                                                         'points': p,
-                                                         'dpt': round((board_time.days + 1) / p, 1)})
-
-
-# create a dict with key = day ISO, value = counters and points of the day
-def calc_report_values(rows, config):
-    report_values = {}
-    for i in range(1, len(rows)):
-        process_row(rows[i], report_values, config)
-    return report_values
+    return {'totals': [0, 0.0, 0, 0.0, 0, 0.0], 'board_days': [[], [], []], 'days_per_point': [[], [], []]}
+
 
+# the biggies entry of an issue whose points exceed the threshold
+def big_points_entry(row, config):
+    return {'date': day_key(get_resolved_date(row, config).toordinal()),
+            'type': get_issue_type(row, config),
+            'points': get_points(row, config),
+            'URL': get_issue_key(row, config)}
 
-# collect all issues whose points exceed the threshold
-def find_big_points(rows, config):
+
+# Consume the data rows (without the heading) in a single pass and return
+# - a dict with key = day ordinal, value = counters and points of the day
+# - the list of issues whose points exceed the threshold
+# - the earliest and the latest resolution date
+# The rows are grouped by their resolution day, so the day entry is looked up once per day and not once per row.
+# Jira delivers the rows sorted by resolution date; unsorted CSV rows just produce more groups for the same day
+# and still span the whole date range.
+def calc_report_values(rows, config):
+    report_values = {}
     biggies = []
-    for i in range(1, len(rows)):
-        row = rows[i]
-        p = get_points(row, config)
-        if p > POINTS_THRESHOLD:
-            biggies.append({'date': day_key(get_resolved_date(row, config)),
-                            'type': get_issue_type(row, config),
-                            'points': p,
-                            'URL': get_issue_key(row, config)})
-    return biggies
+    start_date = end_date = None
+    # the column indexes are bound once, the loop below runs for every row
+    is_project = config['is_project']   # CSV exports don't have the history
+    res_col, type_col, points_col = config[RESOLVED_COL], config[ISSUETYPE_COL], config[POINTS_COL]
+    key_col, board_col = config[KEY_COL], config.get(BOARD_COL)
+    for res_date, day_rows in groupby(parse_rows(rows, config), key=itemgetter(res_col)):
+        if start_date is None or res_date < start_date:
+            start_date = res_date
+        if end_date is None or res_date > end_date:
+            end_date = res_date
+        values = report_values.setdefault(res_date.toordinal(), new_day_values())
+        totals = values['totals']
+        for row in day_rows:
+            base = _TYPE_BASE.get(row[type_col])
+            if base is None:
+                base = _TYPE_BASE[row[type_col].lower()]
+            totals[base] += 1  # count and points of the type are next to each other in totals
+            p = row[points_col]
+            if p != 0:
+                totals[base + 1] += p
+            if p > POINTS_THRESHOLD:
+                biggies.append(big_points_entry(row, config))
+
+            if is_project:
+                t = base >> 1  # the TYPE_INDEX slot
+                issue_key = row[key_col]
+                board_days = (res_date - row[board_col]).days + 1
+                # board_days is a list of issues with their days spent on the Kanban board
+                values['board_days'][t].append({'issue_key': issue_key, 'days': board_days})
+                if p != 0:
+                    values['days_per_point'][t].append({'issue_key': issue_key,
+                                                        'days': board_days,
+                                                        'points': p,
+                                                        'dpt': round(board_days / p, 1)})
+    return report_values, biggies, start_date, end_date
+
+
+# the serialized values of a day without any resolved issues
+EMPTY_DAY_VALUES = (0, 0.0, 0, 0.0, 0, 0.0)
 
 
 # transform the dict of a day into a sequence of values
 def serialize_day_values(val):
-    return [val['bug']['count'], val['bug']['points'], val['task']['count'], val['task']['points'],
-            val['story']['count'], val['story']['points']]
+    return val['totals']
 
 
-# run a date loop across the report's time interval and fill in the collected day values;
-# dates that have no data default to 0 values
+# walk through the collected days in date order across the report's time interval;
+# dates that have no data in between default to 0 values
 def generate_timeseries(report_values, start_date, end_date):
-    for d in daterange(start_date, end_date):
-        key = day_key(d)
-        yield [key] + serialize_day_values(report_values.get(key, new_day_values()))
+    cursor = start_date.toordinal()  # the next day of the time series
+    for d, values in sorted(report_values.items()):
+        for empty in range(cursor, d):
+            yield [day_key(empty), *EMPTY_DAY_VALUES]
+        yield [day_key(d), *serialize_day_values(values)]
+        cursor = d + 1
+    for empty in range(cursor, end_date.toordinal() + 1):
+        yield [day_key(empty), *EMPTY_DAY_VALUES]
+
 
+# divide the second by the first column for each pair of columns; 0 where the denominator is 0
+def calculate_pairwise_relations(columns):
+    return [[0.0 if d == 0 else n / d for d, n in zip(denominators, numerators)]
+            for denominators, numerators in zip(columns[0::2], columns[1::2])]
 
-# divide the second by the first value for each pair in the sequence; 0 if the denominator is 0
-def calculate_pairwise_relations(pairs):
-    return [0.0 if pairs[i - 1] == 0 else pairs[i] / pairs[i - 1] for i in range(1, int(len(pairs)), 2)]
+
+# the moving average of each day of a value column
+def moving_averages(column):
+    # the window of the first days has still insufficient rows, their average is 0
+    window = deque(islice(column, MOVING_AVG_INTERVAL - 1), maxlen=MOVING_AVG_INTERVAL)
+    yield from [0] * len(window)
+    for value in islice(column, MOVING_AVG_INTERVAL - 1, None):
+        window.append(value)  # shift the window by one day, a full window drops its oldest day on append
+        yield sum(window) / MOVING_AVG_INTERVAL
 
 
 # extend each day's values with moving averages and other stuff
 # while generating a proper time series without holes
+# The averages and relations are calculated column by column for the whole series and then zipped into the rows.
 def generate_rows(report_values, start_date, end_date):
-    rowcount = 1
-    windows = [[], [], [], [], [], []]  # one interval sliding window for each individual average value
-    for d in generate_timeseries(report_values, start_date, end_date):
-        # d is a sequence of values; the average's source values are from column 1 (=date) onwards
-        avg = []
-        for i in range(0, 6):
-            windows[i].append(d[i + 1])  # extend the window by one day
-            if rowcount >= MOVING_AVG_INTERVAL:
-                # window has sufficient rows, can calculate the average
-                avg.append(sum(windows[i]) / MOVING_AVG_INTERVAL)
-                windows[i].pop(0)  # make room to shift the window by one day
-            else:
-                # window has still insufficient rows
-                avg.append(0)
-        rowcount += 1
-        yield d + avg + calculate_pairwise_relations(avg)  # three sequences appended to form the row values
-
-
-# calculate the story points distribution
-# The distribution has the points value on the horizontal axis and one associated value for each task type
-def generate_distribution(report_values):
-    dist = {}  # key = points counter, value = list of counters for each task type
-    types = ['bug', 'task', 'story']
-    for v in report_values:
-        for i, t in enumerate(types):
-            p = report_values[v][t]['points']
-            if p > 0:
-                dist.setdefault(p, [0, 0, 0])
-                dist[p][i] += 1
-    return dist
+    series = list(generate_timeseries(report_values, start_date, end_date))
+    # one column for each individual average value; the source values are from column 1 (=date) onwards
+    averages = [list(moving_averages(column)) for column in zip(*(d[1:] for d in series))]
+    relations = calculate_pairwise_relations(averages)
+    for d, avg, rel in zip(series, zip(*averages), zip(*relations)):
+        yield [*d, *avg, *rel]  # three sequences appended to form the row values
 
 
+# Calculate the story points distribution and the story days distribution in a single pass over the days.
+# The points distribution has the points value on the horizontal axis and one associated value for each task type.
 # The story days distribution separates by points. For each point value it produces (board_days, count) value pairs.
 # This can be used to plot the board days on the x-axis and the counter on the y-axis.
-def generate_days_distribution(report_values):
-    result = {}  # key = point value, value = dict of k=board_days, v=count
-    for v in report_values:
-        for issue_type in ['story', 'task']:  # modify this line depending on the project; not all have valid data for all task types
-            issue = report_values[v][issue_type]
-            p = issue['points']
+def generate_distributions(report_values):
+    dist = defaultdict(lambda: [0, 0, 0])  # key = points counter, value = list of counters for each task type
+    days_dist = defaultdict(Counter)  # key = point value, value = counter of k=board_days, v=count
+    days_types = [TYPE_INDEX['story'], TYPE_INDEX['task']]  # modify this line depending on the project; not all have valid data for all task types
+    for values in report_values.values():
+        totals = values['totals']
+        # the points of bug, task and story are in the odd slots of totals; unrolled, it's just three types
+        if totals[1] > 0:
+            dist[totals[1]][0] += 1
+        if totals[3] > 0:
+            dist[totals[3]][1] += 1
+        if totals[5] > 0:
+            dist[totals[5]][2] += 1
+        for t in days_types:
+            p = totals[2 * t + 1]
             if p > 0:
                 # count the occurrence of each board day for the current point
-                for d in issue['board_days']:
-                    result.setdefault(p, {})
-                    result[p].setdefault(d['days'], 0)
-                    result[p][d['days']] += 1
-    return result
+                for d in values['board_days'][t]:
+                    days_dist[p][d['days']] += 1
+    return dict(dist), dict(days_dist)  # plain dicts, a lookup of a missing key must not add it
+
+
+# transform the points distribution into rows of points value and the counters of each task type, sorted by points
+def serialize_distribution(dist):
+    return ([k] + dist[k] for k in sorted(dist))
 
 
 def generate_board_days(report_values, issue_type):
     result = []  # a list of [date, days, issue_key] for each issue
-    for v in report_values:
-        bdays = report_values[v][issue_type]['board_days']
-        for bd in bdays:
-            result.append([v, bd['days'], bd['issue_key']])
+    t = TYPE_INDEX[issue_type]
+    for v, values in report_values.items():
+        bdays = values['board_days'][t]
+        if bdays:
+            date_str = day_key(v)  # formatted once per day, not per issue
+            result.extend([date_str, bd['days'], bd['issue_key']] for bd in bdays)
     return result
 
 
 def generate_days_per_point(report_values, issue_type):
     result = []  # a list of: [date, days per point, issue_key] for each issue
-    for v in report_values:
-        bdays = report_values[v][issue_type]['days_per_point']
-        for bd in bdays:
-            result.append([v, bd['dpt'],  bd['points'], bd['days'], bd['issue_key']])
+    t = TYPE_INDEX[issue_type]
+    for v, values in report_values.items():
+        bdays = values['days_per_point'][t]
+        if bdays:
+            date_str = day_key(v)  # formatted once per day, not per issue
+            result.extend([date_str, bd['dpt'],  bd['points'], bd['days'], bd['issue_key']] for bd in bdays)
     return result
 
 
@@ -262,17 +317,14 @@ def determine_source(source):
         return True, source
 
 
-# read a CSV export file
-def read_rows(filename):
-    rows = []
+# read a CSV export file row by row, the rows are processed while they are read
+def iter_rows(filename):
     with open(filename) as csvfile:
-        rd = csv.reader(csvfile, delimiter=',')
-        for row in rd:
-            rows.append(row)
-    return rows
+        yield from csv.reader(csvfile, delimiter=',')
 
 
 # the Jira direct rows will look as if they came from a Jira export CSV file
+# Like iter_rows, this returns an iterator over the heading and the data rows.
 def jira_online(project):
     end_date = round_down_time(datetime.today())
     if len(sys.argv) < 4:
@@ -284,8 +336,8 @@ def jira_online(project):
         end_date = datetime.strptime(sys.argv[4], '%Y-%m-%d')
     print('getting issues for project "{}" with end date {} for user {}'.format(project, end_date, arg_user))
     print('ignore the warnings that come from the disabled certificate validation')
-    return [['Issue key', 'Issue id', 'Issue Type', 'Custom field (Story Points)', 'Resolved',
-             'board enter date']] + get_project_issues(project, arg_user, arg_pwd, end_date)
+    heading = ['Issue key', 'Issue id', 'Issue Type', 'Custom field (Story Points)', 'Resolved', 'board enter date']
+    return chain([heading], get_project_issues(project, arg_user, arg_pwd, end_date))
 
 
 def run_calculations():
@@ -296,36 +348,39 @@ def run_calculations():
         # get rid of blanks in the project name
         basename = source.replace(' ', '_')
     else:
-        rows = read_rows(source)
+        rows = iter_rows(source)
         basename = os.path.splitext(source)[0]
 
-    if len(rows) > 1:
-        config = { 'is_project': is_project}
-        column_configuration(rows[0], config)
-        print('detected columns: ', config)
+    header = next(rows, None)
+    if header is None:
+        print('Input file is empty, exiting')
+        exit(0)
+    config = { 'is_project': is_project}
+    column_configuration(header, config)
+    print('detected columns: ', config)
 
+    report_values, biggies, start_date, end_date = calc_report_values(rows, config)
+    if report_values:
         out_stats = basename + '_statistics.csv'
-        report_values = calc_report_values(rows, config)
-        write_statistics(report_values, rows, config, out_stats)
+        write_statistics(report_values, start_date, end_date, out_stats)
 
         out_distribution = basename + '_distribution.csv'
-        dist = generate_distribution(report_values)
+        dist, sd_dist = generate_distributions(report_values)
         write_points_distribution(dist, out_distribution)
 
         out_biggies = basename + '_biggies.csv'
-        biggies = find_big_points(rows, config)
         write_biggies(biggies, out_biggies)
 
         if config['is_project']:
             out_sd_distribution = basename + '_days_distribution.csv'
-            sd_dist = generate_days_distribution(report_values)
             write_days_distribution(sd_dist, out_sd_distribution)
-            write_board_days(report_values, 'bug', basename)
-            write_board_days(report_values, 'task', basename)
-            write_board_days(report_values, 'story', basename)
-            write_days_per_point(report_values, 'bug', basename)
-            write_days_per_point(report_values, 'task', basename)
-            write_days_per_point(report_values, 'story', basename)
+            # the six files are independent of each other, so they are written concurrently
+            issue_types = ['bug', 'task', 'story']
+            with ThreadPoolExecutor(max_workers=6) as executor:
+                futures = ([executor.submit(write_board_days, report_values, t, basename) for t in issue_types] +
+                           [executor.submit(write_days_per_point, report_values, t, basename) for t in issue_types])
+                for f in futures:
+                    f.result()  # raises the exception of a failed write
 
     else:
         print('Input file has no data, exiting')
@@ -338,8 +393,7 @@ def write_board_days(report_values, issue_type, basename):
         print('writing ' + filename)
         wr = csv.writer(outfile)
         wr.writerow(['date', 'days', 'key'])
-        for r in generate_board_days(report_values, issue_type):
-            wr.writerow(r)
+        wr.writerows(generate_board_days(report_values, issue_type))
 
 
 def write_days_per_point(report_values, issue_type, basename):
@@ -348,8 +402,7 @@ def write_days_per_point(report_values, issue_type, basename):
         print('writing ' + filename)
         wr = csv.writer(outfile)
         wr.writerow(['date', 'days/point', 'points', 'days', 'key'])
-        for r in generate_days_per_point(report_values, issue_type):
-            wr.writerow(r)
+        wr.writerows(generate_days_per_point(report_values, issue_type))
 
 
 def csv_headline_stats():
@@ -358,32 +411,32 @@ def csv_headline_stats():
             'avg_story_points', 'bug p/c', 'task p/c', 'story p/c']
 
 
-def write_statistics(report_values, rows, config, out_stats):
+# The statistics and the points distribution consist of numbers, dates and fixed headings, nothing needs quoting.
+# Joining the values directly saves the csv module's quoting checks of each field; the line end is the csv.writer one.
+def write_plain_rows(outfile, rows):
+    outfile.writelines(','.join(map(str, row)) + '\r\n' for row in rows)
+
+
+def write_statistics(report_values, start_date, end_date, out_stats):
     with open(out_stats, "w", newline='') as outfile:
         print('writing ' + out_stats)
-        wr = csv.writer(outfile)
-        wr.writerow(csv_headline_stats())
-        for d in generate_rows(report_values, get_start_date(rows, config), get_end_date(rows, config)):
-            # print(d)
-            wr.writerow(d)
+        write_plain_rows(outfile, [csv_headline_stats()])
+        write_plain_rows(outfile, generate_rows(report_values, start_date, end_date))
     return report_values
 
 
 def write_biggies(biggies, out_biggies):
     with open(out_biggies, "w") as outfile:
         print('writing ' + out_biggies)
-        outfile.write('date,type,points,URL\n')
-        for b in biggies:
-            outfile.write('{},{},{},{}/browse/{}\n'.format(b['date'], b['type'], b['points'], JIRA_URL, b['URL']))
+        outfile.write('date,type,points,URL\n' +
+                      ''.join(f"{b['date']},{b['type']},{b['points']},{JIRA_URL}/browse/{b['URL']}\n" for b in biggies))
 
 
 def write_points_distribution(dist, out_distribution):
     with open(out_distribution, "w", newline='') as outfile:
         print('writing ' + out_distribution)
-        wr = csv.writer(outfile)
-        wr.writerow(['points', 'bug', 'task', 'story'])
-        for k in sorted(dist):
-            wr.writerow([k] + dist[k])
+        write_plain_rows(outfile, [['points', 'bug', 'task', 'story']])
+        write_plain_rows(outfile, serialize_distribution(dist))
 
 
 def write_days_distribution(dist, out_distribution):
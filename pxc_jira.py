@@ -3,6 +3,7 @@
 #
 
 from jira import JIRA
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
 # project convenience shortcuts, avoids using blanks on the commandline
@@ -10,6 +11,10 @@ PROJECTS = {'product': '[SCS] Product', 'explore': '[SCS] Explore'}
 POINTS = 'customfield_10106'
 MAX_DAYS = 555
 JIRA_URL = 'https://jira-web.europe.phoenixcontact.com'
+MAX_WORKERS = 8  # concurrent requests to Jira
+# the Scrum workflow states in the order in which they are tried for the board enter date
+STATUS_PRIORITY = {'initiation': 0, 'refinement': 1, 'in progress': 2, 'review': 3, 'approved': 4, 'done': 5,
+                   'operation': 6}
 
 
 def get_session(credentials):
@@ -26,13 +31,10 @@ def format_query_date(date):
     return datetime.strftime(date, '%Y-%m-%d')
 
 
-def format_data_date(date):
-    return datetime.strftime(date, '%d.%m.%y %H:%M')
-
-
 def format_status_date(datestring):
-    # example date from Jira: 2021-01-04T11:13:36.000+0100
-    return format_data_date(datetime.fromisoformat(datestring[0:19]))
+    # example date from Jira: 2021-01-04T11:13:36.000+0100 -> 04.01.21 11:13
+    # Jira always sends this fixed-width form, so the fields are rearranged without parsing them into a datetime.
+    return f'{datestring[8:10]}.{datestring[5:7]}.{datestring[2:4]} {datestring[11:16]}'
 
 
 def jql_resolved(project, end_date):
@@ -47,20 +49,48 @@ def jql_resolved(project, end_date):
     return q
 
 
-# page through the query until it is empty
-def get_issues(session, project, end_date):
+# Get one page of issues, without those from the excluded end index on. Only the history is needed from the changelog,
+# and only for the board enter date, so it is evaluated right here while the other pages are still on their way.
+def search_page(session, query, start, end=None):
+    issues = session.search_issues(query, fields=[POINTS, 'issuetype', 'resolutiondate'], expand='changelog',
+                                   startAt=start)
+    if end is not None:
+        issues = issues[:end - start]  # a bigger page must not overlap the next range
+    for issue in issues:
+        issue.board_enter_date = find_board_enter_date(issue)
+    return issues
+
+
+# Get the issues from start up to the excluded end index, or up to the last issue if there is no end.
+# Jira may deliver fewer issues per page than asked for (e.g. for heavy changelogs), so the range is paged through
+# until it is complete or a page comes back empty.
+def search_range(session, query, start, end=None):
     result = []
-    start = 0
-    query = jql_resolved(project, end_date)
-    while True:
-        issues = session.search_issues(query, fields=[POINTS, 'issuetype', 'resolutiondate'], expand='changelog',
-                                       startAt=start)
-        # print(issues)
+    while end is None or start < end:
+        issues = search_page(session, query, start, end)
         if len(issues) == 0:
             break
-        else:
-            result += issues
-            start += len(issues)
+        result.extend(issues)
+        start += len(issues)
+    return result
+
+
+# The first page tells the total number of issues and the page size, the remaining pages are then fetched
+# concurrently. Each page is a full round trip to Jira, so waiting for them one after the other takes ages.
+def get_issues(session, project, end_date):
+    query = jql_resolved(project, end_date)
+    issues = search_page(session, query, 0)
+    if len(issues) == 0:
+        return []
+    page_size = issues.maxResults  # the page size Jira works with, the first page itself may be shorter
+    result = list(issues) + search_range(session, query, len(issues), page_size)
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        # map delivers the ranges in the order of their start index, the issues stay ordered by resolution date
+        for issues in executor.map(lambda start: search_range(session, query, start, start + page_size),
+                                   range(page_size, issues.total, page_size)):
+            result.extend(issues)
+    # issues that matched the query after the first request are behind the total; page on until an empty page
+    result.extend(search_range(session, query, len(result)))
     return result
 
 
@@ -68,44 +98,40 @@ def get_issues(session, project, end_date):
 # well, the CSV came first, so that's our common denominator
 # having the values in a sequence also has other advantages when it comes to calculating relations
 def issues_to_rows(issues):
-    rows = []
-    for i in issues:
-        rows.append(
-            [i.key, i.id, i.fields.issuetype.name, int(i.fields.customfield_10106 or 0),
-             format_status_date(i.fields.resolutiondate),
-             format_status_date(i.board_enter_date)])
+    rows = [None] * len(issues)  # the number of rows is known, the list does not need to grow
+    for k, i in enumerate(issues):
+        f = i.fields  # looked up once instead of for every field
+        rows[k] = [i.key, i.id, f.issuetype.name, int(f.customfield_10106 or 0),
+                   format_status_date(f.resolutiondate),
+                   format_status_date(i.board_enter_date)]
     return rows
 
 
 # get the issues for a specific project
 def get_project_issues(project, user, pwd, end_date):
     session = get_session((user, pwd))
-    issues = get_issues(session, project, end_date)
-    for issue in issues:
-        issue.board_enter_date = find_board_enter_date(issue)
-    return issues_to_rows(issues)
-
-
-# dig into the history and find each statuschange with the status as key and the date string as value
-def get_issue_statuschanges(issue):
-    changes = {}
-    for history in issue.changelog.histories:
-        for item in history.items:
-            if item.field == 'status':
-                changes[item.toString.lower()] = history.created
-    return changes
+    return issues_to_rows(get_issues(session, project, end_date))
 
 
 # Find the date when the issue entered the Kanban board.
 # The status changes are very inconsistent in the history. Not all seem to be registered. The workflow is practically
 # always incompletely represented.
-# We start with the earliest from the various Scrum workflows.
+# We start with the earliest from the various Scrum workflows (see STATUS_PRIORITY).
+# The history is scanned once, remembering the change to the earliest status found so far. If the issue went through
+# that status more than once, the last change counts.
 def find_board_enter_date(issue):
-    changes = get_issue_statuschanges(issue)
-    for c in ['initiation', 'refinement', 'in progress', 'review', 'approved', 'done', 'operation']:
-        if c in changes:
-            return changes[c]
-    raise 'incomplete history in issue ' + issue.key  # this should not happen, as all issues are done or operation
+    best_priority = len(STATUS_PRIORITY)
+    best_date = None
+    for history in issue.changelog.histories:
+        for item in history.items:
+            if item.field == 'status':
+                priority = STATUS_PRIORITY.get(item.toString.lower())
+                if priority is not None and priority <= best_priority:
+                    best_priority = priority
+                    best_date = history.created
+    if best_date is None:
+        raise 'incomplete history in issue ' + issue.key  # this should not happen, as all issues are done or operation
+    return best_date
 
 
 if __name__ == '__main__':